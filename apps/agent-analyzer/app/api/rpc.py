@@ -1,37 +1,96 @@
-from fastapi import APIRouter
+import msgspec
+from fastapi import APIRouter, Request, Response
+from starlette.datastructures import UploadFile
 
-from app.providers.mock_analyzer import analyze_mock
+from app.providers.mock_analyzer import analyze_mock, decode_content_base64
 from app.schemas.jsonrpc import AnalyzeParams, JsonRpcError, JsonRpcErrorDetail, JsonRpcRequest, JsonRpcSuccess
 
 router = APIRouter()
 
+_request_decoder = msgspec.json.Decoder(JsonRpcRequest)
+_encoder = msgspec.json.Encoder()
+
+
+def _respond(payload: JsonRpcSuccess | JsonRpcError) -> Response:
+    return Response(content=_encoder.encode(payload), media_type="application/json")
+
+
+async def _read_rpc_body(request: Request) -> tuple[bytes, bytes | None]:
+    if not request.headers.get("content-type", "").startswith("multipart/form-data"):
+        return await request.body(), None
+
+    async with request.form() as form:
+        envelope = form.get("request")
+        upload = form.get("file")
+        body = envelope.encode("utf-8") if isinstance(envelope, str) else b""
+        content = await upload.read() if isinstance(upload, UploadFile) else None
+    return body, content
+
+
+@router.post("/rpc")
+async def rpc_handler(request: Request) -> Response:
+    body, content = await _read_rpc_body(request)
+    try:
+        payload = _request_decoder.decode(body)
+    except msgspec.ValidationError as exc:
+        return _respond(
+            JsonRpcError(
+                id=None,
+                error=JsonRpcErrorDetail(code=-32600, message="Invalid Request", data={"detail": str(exc)}),
+            )
+        )
+    except msgspec.DecodeError as exc:
+        return _respond(
+            JsonRpcError(
+                id=None,
+                error=JsonRpcErrorDetail(code=-32700, message="Parse error", data={"detail": str(exc)}),
+            )
+        )
 
-@router.post("/rpc", response_model=JsonRpcSuccess | JsonRpcError)
-def rpc_handler(payload: JsonRpcRequest) -> JsonRpcSuccess | JsonRpcError:
     if payload.jsonrpc != "2.0":
-        return JsonRpcError(
-            id=payload.id,
-            error=JsonRpcErrorDetail(code=-32600, message="Invalid JSON-RPC version"),
+        return _respond(
+            JsonRpcError(
+                id=payload.id,
+                error=JsonRpcErrorDetail(code=-32600, message="Invalid JSON-RPC version"),
+            )
         )
 
     if payload.method != "analyze_receipt":
-        return JsonRpcError(
-            id=payload.id,
-            error=JsonRpcErrorDetail(code=-32601, message=f"Method {payload.method} not found"),
+        return _respond(
+            JsonRpcError(
+                id=payload.id,
+                error=JsonRpcErrorDetail(code=-32601, message=f"Method {payload.method} not found"),
+            )
         )
 
     try:
-        params = AnalyzeParams.model_validate(payload.params)
-    except Exception as exc:  # noqa: BLE001
-        return JsonRpcError(
-            id=payload.id,
-            error=JsonRpcErrorDetail(code=-32602, message="Invalid params", data={"detail": str(exc)}),
+        params = msgspec.convert(payload.params, AnalyzeParams)
+    except msgspec.ValidationError as exc:
+        return _respond(
+            JsonRpcError(
+                id=payload.id,
+                error=JsonRpcErrorDetail(code=-32602, message="Invalid params", data={"detail": str(exc)}),
+            )
         )
 
+    if content is None:
+        if params.content_base64 is None:
+            return _respond(
+                JsonRpcError(
+                    id=payload.id,
+                    error=JsonRpcErrorDetail(
+                        code=-32602,
+                        message="Invalid params",
+                        data={"detail": "Missing file part or content_base64"},
+                    ),
+                )
+            )
+        content = decode_content_base64(params.content_base64)
+
     result = analyze_mock(
         filename=params.filename,
         mime_type=params.mime_type,
-        content_base64=params.content_base64,
+        content=content,
         text_hint=params.text_hint,
     )
-    return JsonRpcSuccess(id=payload.id, result=result)
+    return _respond(JsonRpcSuccess(id=payload.id, result=result))
@@ -1,13 +1,17 @@
 from fastapi import FastAPI
+from fastapi.responses import Response
 
 from app.api.rpc import router as rpc_router
 
 app = FastAPI(title="Receipt Analyzer Agent", version="0.1.0")
 
 
+_HEALTH_RESPONSE = Response(content=b'{"status":"ok"}', media_type="application/json")
+
+
 @app.get("/health")
-def health() -> dict[str, str]:
-    return {"status": "ok"}
+async def health() -> Response:
+    return _HEALTH_RESPONSE
 
 
 app.include_router(rpc_router)
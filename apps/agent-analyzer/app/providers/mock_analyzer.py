@@ -1,17 +1,20 @@
-import base64
 import hashlib
 import re
 from datetime import date
 
+import pybase64
 
-def _extract_text(content_base64: str) -> str:
+
+def decode_content_base64(content_base64: str) -> bytes:
     try:
-        raw = base64.b64decode(content_base64)
+        return pybase64.b64decode(content_base64)
     except Exception:  # noqa: BLE001
-        return ""
+        return b""
+
 
+def _extract_text(content: bytes) -> str:
     # Works for txt/csv and gives a weak fallback for binary formats.
-    return raw.decode("utf-8", errors="ignore")[:8000]
+    return content.decode("utf-8", errors="ignore")[:8000]
 
 
 def _extract_total(text: str) -> float | None:
@@ -40,8 +43,8 @@ def _vendor_from_text_or_filename(text: str, filename: str) -> str:
     return clean_name[:80] or "Proveedor Demo"
 
 
-def analyze_mock(filename: str, mime_type: str, content_base64: str, text_hint: str | None) -> dict:
-    text_blob = f"{text_hint or ''}\n{_extract_text(content_base64)}".strip()
+def analyze_mock(filename: str, mime_type: str, content: bytes, text_hint: str | None) -> dict:
+    text_blob = f"{text_hint or ''}\n{_extract_text(content)}".strip()
     total = _extract_total(text_blob)
 
     fingerprint = hashlib.sha256(f"{filename}:{mime_type}:{text_blob[:300]}".encode("utf-8")).hexdigest()
@@ -1,37 +1,35 @@
 from typing import Any
 
-from pydantic import BaseModel, ConfigDict, Field
+import msgspec
 
 
-class JsonRpcRequest(BaseModel):
-    jsonrpc: str = Field(default="2.0")
+class JsonRpcRequest(msgspec.Struct, kw_only=True):
+    jsonrpc: str = "2.0"
     id: str | int
     method: str
     params: dict[str, Any]
 
 
-class JsonRpcSuccess(BaseModel):
+class JsonRpcSuccess(msgspec.Struct, kw_only=True):
     jsonrpc: str = "2.0"
     id: str | int
     result: dict[str, Any]
 
 
-class JsonRpcErrorDetail(BaseModel):
+class JsonRpcErrorDetail(msgspec.Struct, kw_only=True):
     code: int
     message: str
     data: dict[str, Any] | None = None
 
 
-class JsonRpcError(BaseModel):
+class JsonRpcError(msgspec.Struct, kw_only=True):
     jsonrpc: str = "2.0"
     id: str | int | None
     error: JsonRpcErrorDetail
 
 
-class AnalyzeParams(BaseModel):
+class AnalyzeParams(msgspec.Struct, kw_only=True):
     filename: str
     mime_type: str
-    content_base64: str
+    content_base64: str | None = None
     text_hint: str | None = None
-
-    model_config = ConfigDict(extra="ignore")
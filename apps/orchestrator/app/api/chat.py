@@ -1,138 +1,219 @@
 import asyncio
 import hashlib
-import json
 import os
+import time
 import uuid
+from collections import OrderedDict
 from dataclasses import dataclass
 from datetime import date
-from typing import Any
+from typing import IO, Any
 
+import orjson
 from fastapi import APIRouter, Depends, File, Form, HTTPException, UploadFile, status
 from fastapi.responses import StreamingResponse
 from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, undefer
 
+from app.api.responses import APIJSONResponse
 from app.config import get_settings
 from app.db import get_db
 from app.models import Attachment, Conversation, ExtractionRun, Message, Receipt, ReceiptItem
 from app.schemas import ChatResponse, MessageOut
-from app.services.agent_client import AgentClient, AgentClientError
+from app.services.agent_client import AgentClient, AgentClientError, get_agent_client
+from app.services.ids import parse_uuid
 from app.services.query_interpreter import handle_text_query
 from app.services.receipt_mapper import load_receipt_items, serialize_receipt
 from app.services.receipt_validation import validate_receipt_payload, validate_upload
 
 router = APIRouter(prefix="/api/v1/chat", tags=["chat"])
-agent_client = AgentClient()
 settings = get_settings()
 
+_SMALL_UPLOAD_BYTES = 1 << 20
+_LARGE_UPLOAD_BYTES = 64 << 20
+_STREAM_CHUNK_CHARS = 256
+
+_CREATED_DIRS: set[str] = set()
+
+# sha256 -> id of the first receipt stored for that content. Hits are re-checked against the DB,
+# so a stale entry can only cost the fallback query.
+_RECEIPT_BY_SHA256: OrderedDict[str, uuid.UUID] = OrderedDict()
+_RECEIPT_BY_SHA256_MAX = 4096
+
 
 @dataclass(slots=True)
 class FilePayload:
     filename: str
     mime_type: str
-    content: bytes
+    temp_path: str
+    sha256: str
+    size: int
 
 
-def _get_or_create_conversation(db: Session, conversation_id: str | None) -> Conversation:
-    if conversation_id:
-        existing = db.query(Conversation).filter(Conversation.id == conversation_id).first()
-        if existing:
-            return existing
-        conversation = Conversation(id=conversation_id)
-    else:
-        conversation = Conversation()
+def _parse_conversation_id(conversation_id: str | None) -> uuid.UUID | None:
+    if not conversation_id:
+        return None
 
-    db.add(conversation)
-    db.commit()
-    db.refresh(conversation)
-    return conversation
+    parsed_id = parse_uuid(conversation_id)
+    if parsed_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="conversation_id invalido")
+    return parsed_id
 
 
-def _create_message(db: Session, conversation_id: str, role: str, text: str, intent: str | None = None) -> Message:
-    message = Message(conversation_id=conversation_id, role=role, text=text, intent=intent)
-    db.add(message)
-    db.commit()
-    db.refresh(message)
-    return message
+def _get_or_create_conversation(db: Session, conversation_id: uuid.UUID | None) -> Conversation:
+    if conversation_id is None:
+        # The id is assigned up front because the attachment directory is named after it before flushing.
+        return Conversation(id=uuid.uuid4())
+
+    return db.get(Conversation, conversation_id) or Conversation(id=conversation_id)
+
+
+def _build_message(conversation: Conversation, role: str, text: str, intent: str | None = None) -> Message:
+    return Message(conversation=conversation, role=role, text=text, intent=intent)
 
 
 def _safe_float(value: Any) -> float | None:
     if value is None:
         return None
+    if type(value) is float:
+        return value
+    if type(value) is int:
+        return float(value)
     try:
         return float(value)
     except (TypeError, ValueError):
         return None
 
 
+def _upload_buffer_size(size_hint: int | None) -> int:
+    if size_hint and size_hint <= _SMALL_UPLOAD_BYTES:
+        return 64 << 10
+    if not size_hint or size_hint <= _LARGE_UPLOAD_BYTES:
+        return 1 << 20
+    return 4 << 20
+
+
+def _spool_upload(source: IO[bytes], out_file: IO[bytes], digest: Any, buffer_size: int) -> int:
+    view = memoryview(bytearray(buffer_size))
+    size = 0
+    while read := source.readinto(view):
+        size += read
+        if size > settings.max_upload_bytes:
+            break
+        digest.update(view[:read])
+        out_file.write(view[:read])
+    return size
+
+
 async def _read_file_payload(file: UploadFile | None) -> FilePayload | None:
     if file is None:
         return None
 
-    content = await file.read()
-    payload = FilePayload(
-        filename=file.filename or "attachment.bin",
-        mime_type=file.content_type or "application/octet-stream",
-        content=content,
-    )
+    filename = file.filename or "attachment.bin"
+    mime_type = file.content_type or "application/octet-stream"
 
-    validate_upload(
-        filename=payload.filename,
-        mime_type=payload.mime_type,
-        size_bytes=len(payload.content),
-        settings=settings,
+    incoming_dir = os.path.join(settings.upload_dir, "incoming")
+    _ensure_dir(incoming_dir)
+    temp_path = os.path.join(incoming_dir, f"{uuid.uuid4()}_{filename}")
+
+    digest = hashlib.sha256()
+    size = 0
+    buffer_size = _upload_buffer_size(file.size)
+    try:
+        with open(temp_path, "wb") as out_file:
+            if hasattr(file.file, "readinto"):
+                size = await asyncio.to_thread(_spool_upload, file.file, out_file, digest, buffer_size)
+            else:
+                while chunk := await file.read(buffer_size):
+                    size += len(chunk)
+                    if size > settings.max_upload_bytes:
+                        break
+                    digest.update(chunk)
+                    await asyncio.to_thread(out_file.write, chunk)
+
+        validate_upload(
+            filename=filename,
+            mime_type=mime_type,
+            size_bytes=size,
+            settings=settings,
+        )
+    except BaseException:
+        _discard_file(temp_path)
+        raise
+
+    return FilePayload(
+        filename=filename,
+        mime_type=mime_type,
+        temp_path=temp_path,
+        sha256=digest.hexdigest(),
+        size=size,
     )
 
-    return payload
 
+def _ensure_dir(path: str) -> None:
+    if path not in _CREATED_DIRS:
+        os.makedirs(path, exist_ok=True)
+        _CREATED_DIRS.add(path)
 
-def _store_attachment(db: Session, message_id: str, conversation_id: str, payload: FilePayload) -> Attachment:
-    conversation_dir = os.path.join(settings.upload_dir, conversation_id)
-    os.makedirs(conversation_dir, exist_ok=True)
 
-    stored_filename = f"{uuid.uuid4()}_{payload.filename}"
-    storage_path = os.path.join(conversation_dir, stored_filename)
+def _read_stored_file(path: str) -> bytes:
+    with open(path, "rb") as stored_file:
+        return stored_file.read()
+
 
-    with open(storage_path, "wb") as out_file:
-        out_file.write(payload.content)
+def _discard_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _build_attachment(message: Message, payload: FilePayload) -> Attachment:
+    conversation_dir = os.path.join(settings.upload_dir, str(message.conversation.id))
+    _ensure_dir(conversation_dir)
 
-    attachment = Attachment(
-        message_id=message_id,
+    stored_filename = os.path.basename(payload.temp_path)
+    storage_path = os.path.join(conversation_dir, stored_filename)
+    os.replace(payload.temp_path, storage_path)
+
+    return Attachment(
+        message=message,
         filename=payload.filename,
         mime_type=payload.mime_type,
         storage_path=storage_path,
-        sha256=hashlib.sha256(payload.content).hexdigest(),
+        sha256=payload.sha256,
+    )
+
+
+def _persist_items(db: Session, receipt_id: uuid.UUID, items: list[dict[str, Any]]) -> None:
+    if not items:
+        return
+
+    db.bulk_insert_mappings(
+        ReceiptItem,
+        [
+            {
+                "receipt_id": receipt_id,
+                "description": item.get("description") or "Item",
+                "quantity": _safe_float(item.get("quantity")) or 1,
+                "unit_price": _safe_float(item.get("unit_price")),
+                "line_total": _safe_float(item.get("line_total")),
+            }
+            for item in items
+        ],
     )
-    db.add(attachment)
-    db.commit()
-    db.refresh(attachment)
-    return attachment
-
-
-def _persist_items(db: Session, receipt_id: str, items: list[dict[str, Any]]) -> None:
-    for item in items:
-        db.add(
-            ReceiptItem(
-                receipt_id=receipt_id,
-                description=item.get("description") or "Item",
-                quantity=_safe_float(item.get("quantity")) or 1,
-                unit_price=_safe_float(item.get("unit_price")),
-                line_total=_safe_float(item.get("line_total")),
-            )
-        )
 
 
-def _create_receipt_from_agent(
+async def _create_receipt_from_agent(
     db: Session,
-    conversation_id: str,
+    agent_client: AgentClient,
+    conversation_id: uuid.UUID,
     attachment: Attachment,
-    file_bytes: bytes,
     text_hint: str | None,
 ) -> tuple[Receipt, list[str]]:
-    import time
+    file_bytes = await asyncio.to_thread(_read_stored_file, attachment.storage_path)
 
     start = time.perf_counter()
-    result = agent_client.analyze_receipt(
+    result = await agent_client.analyze_receipt(
         file_bytes=file_bytes,
         filename=attachment.filename,
         mime_type=attachment.mime_type,
@@ -143,14 +224,6 @@ def _create_receipt_from_agent(
     receipt_payload = result.get("receipt", {})
     receipt_payload, validation_warnings, receipt_status = validate_receipt_payload(receipt_payload)
 
-    issue_date_str = receipt_payload.get("issue_date")
-    issue_date = None
-    if issue_date_str:
-        try:
-            issue_date = date.fromisoformat(str(issue_date_str))
-        except ValueError:
-            issue_date = None
-
     raw_json = dict(result)
     raw_json["validation"] = {
         "warnings": validation_warnings,
@@ -163,7 +236,7 @@ def _create_receipt_from_agent(
         vendor_name=receipt_payload.get("vendor_name") or "Proveedor desconocido",
         vendor_tax_id=receipt_payload.get("vendor_tax_id"),
         receipt_number=receipt_payload.get("receipt_number"),
-        issue_date=issue_date,
+        issue_date=receipt_payload["issue_date"],
         currency=receipt_payload.get("currency") or "PEN",
         subtotal=_safe_float(receipt_payload.get("subtotal")),
         tax=_safe_float(receipt_payload.get("tax")),
@@ -175,8 +248,7 @@ def _create_receipt_from_agent(
         raw_json=raw_json,
     )
     db.add(receipt)
-    db.commit()
-    db.refresh(receipt)
+    db.flush()
 
     _persist_items(db, receipt.id, receipt_payload.get("items", []))
 
@@ -197,7 +269,7 @@ def _create_receipt_from_agent(
 
 def _create_duplicate_receipt(
     db: Session,
-    conversation_id: str,
+    conversation_id: uuid.UUID,
     attachment: Attachment,
     source_receipt: Receipt,
 ) -> Receipt:
@@ -209,32 +281,35 @@ def _create_duplicate_receipt(
         receipt_number=source_receipt.receipt_number,
         issue_date=source_receipt.issue_date,
         currency=source_receipt.currency,
-        subtotal=_safe_float(source_receipt.subtotal),
-        tax=_safe_float(source_receipt.tax),
-        total=_safe_float(source_receipt.total),
+        subtotal=source_receipt.subtotal,
+        tax=source_receipt.tax,
+        total=source_receipt.total,
         payment_method=source_receipt.payment_method,
         confidence=source_receipt.confidence,
         status="duplicate",
         raw_text=source_receipt.raw_text,
         raw_json={
             "source": "sha256",
-            "duplicate_of_receipt_id": source_receipt.id,
+            "duplicate_of_receipt_id": str(source_receipt.id),
         },
     )
     db.add(duplicated)
-    db.commit()
-    db.refresh(duplicated)
+    db.flush()
 
     source_items = load_receipt_items(db, source_receipt.id)
-    for item in source_items:
-        db.add(
-            ReceiptItem(
-                receipt_id=duplicated.id,
-                description=item.description,
-                quantity=_safe_float(item.quantity) or 1,
-                unit_price=_safe_float(item.unit_price),
-                line_total=_safe_float(item.line_total),
-            )
+    if source_items:
+        db.bulk_insert_mappings(
+            ReceiptItem,
+            [
+                {
+                    "receipt_id": duplicated.id,
+                    "description": item.description,
+                    "quantity": item.quantity or 1,
+                    "unit_price": item.unit_price,
+                    "line_total": item.line_total,
+                }
+                for item in source_items
+            ],
         )
 
     db.add(
@@ -254,7 +329,7 @@ def _create_duplicate_receipt(
 
 def _create_failed_receipt(
     db: Session,
-    conversation_id: str,
+    conversation_id: uuid.UUID,
     attachment: Attachment,
     *,
     error_code: str,
@@ -274,8 +349,7 @@ def _create_failed_receipt(
         },
     )
     db.add(receipt)
-    db.commit()
-    db.refresh(receipt)
+    db.flush()
 
     db.add(
         ExtractionRun(
@@ -292,6 +366,43 @@ def _create_failed_receipt(
     return receipt
 
 
+def _remember_receipt_hash(sha256: str, receipt_id: uuid.UUID) -> None:
+    if sha256 in _RECEIPT_BY_SHA256:
+        _RECEIPT_BY_SHA256.move_to_end(sha256)
+        return
+
+    _RECEIPT_BY_SHA256[sha256] = receipt_id
+    if len(_RECEIPT_BY_SHA256) > _RECEIPT_BY_SHA256_MAX:
+        _RECEIPT_BY_SHA256.popitem(last=False)
+
+
+def _find_duplicate_source(db: Session, attachment: Attachment) -> Receipt | None:
+    cached_id = _RECEIPT_BY_SHA256.get(attachment.sha256)
+    if cached_id:
+        cached = db.get(Receipt, cached_id, options=[undefer(Receipt.raw_text)])
+        if cached:
+            _RECEIPT_BY_SHA256.move_to_end(attachment.sha256)
+            return cached
+        del _RECEIPT_BY_SHA256[attachment.sha256]
+
+    source = (
+        db.query(Receipt)
+        .options(undefer(Receipt.raw_text))
+        .join(Attachment, Receipt.attachment_id == Attachment.id)
+        .filter(
+            and_(
+                Attachment.sha256 == attachment.sha256,
+                Attachment.id != attachment.id,
+            )
+        )
+        .order_by(Receipt.created_at.asc())
+        .first()
+    )
+    if source:
+        _remember_receipt_hash(attachment.sha256, source.id)
+    return source
+
+
 def _find_business_duplicate_candidate(db: Session, receipt: Receipt) -> Receipt | None:
     if not receipt.receipt_number or not receipt.issue_date or receipt.total is None:
         return None
@@ -311,9 +422,10 @@ def _find_business_duplicate_candidate(db: Session, receipt: Receipt) -> Receipt
     )
 
 
-def _process_message(
+async def _process_message(
     db: Session,
-    conversation_id: str | None,
+    agent_client: AgentClient,
+    conversation_id: uuid.UUID | None,
     text: str,
     file_payload: FilePayload | None,
 ) -> ChatResponse:
@@ -322,27 +434,20 @@ def _process_message(
 
     conversation = _get_or_create_conversation(db, conversation_id)
     user_text = text if text else f"[file] {file_payload.filename if file_payload else 'sin-nombre'}"
-    user_message = _create_message(db, conversation.id, "user", user_text)
+    user_message = _build_message(conversation, "user", user_text)
 
     if file_payload is None:
         result = handle_text_query(db, text)
-        _create_message(db, conversation.id, "assistant", result.message, intent="query")
+        assistant_message = _build_message(conversation, "assistant", result.message, intent="query")
+        db.add_all([conversation, user_message, assistant_message])
+        db.commit()
         return ChatResponse(conversation_id=conversation.id, assistant_message=result.message, data=result.data)
 
-    attachment = _store_attachment(db, user_message.id, conversation.id, file_payload)
+    attachment = _build_attachment(user_message, file_payload)
+    db.add_all([conversation, user_message, attachment])
+    db.flush()
 
-    duplicate_source = (
-        db.query(Receipt)
-        .join(Attachment, Receipt.attachment_id == Attachment.id)
-        .filter(
-            and_(
-                Attachment.sha256 == attachment.sha256,
-                Attachment.id != attachment.id,
-            )
-        )
-        .order_by(Receipt.created_at.asc())
-        .first()
-    )
+    duplicate_source = _find_duplicate_source(db, attachment)
 
     if duplicate_source:
         receipt = _create_duplicate_receipt(db, conversation.id, attachment, duplicate_source)
@@ -353,7 +458,8 @@ def _process_message(
             f"Archivo duplicado detectado por hash. Se registro el comprobante {receipt.id} "
             f"enlazado al original {duplicate_source.id}."
         )
-        _create_message(db, conversation.id, "assistant", assistant_text, intent="analyze_receipt_duplicate")
+        db.add(_build_message(conversation, "assistant", assistant_text, intent="analyze_receipt_duplicate"))
+        db.commit()
 
         return ChatResponse(
             conversation_id=conversation.id,
@@ -362,12 +468,14 @@ def _process_message(
             data=data,
         )
 
+    db.commit()
+
     try:
-        receipt, warnings = _create_receipt_from_agent(
+        receipt, warnings = await _create_receipt_from_agent(
             db=db,
+            agent_client=agent_client,
             conversation_id=conversation.id,
             attachment=attachment,
-            file_bytes=file_payload.content,
             text_hint=text or None,
         )
     except AgentClientError as exc:
@@ -378,12 +486,14 @@ def _process_message(
             error_code=exc.code,
             error_message=str(exc),
         )
+        _remember_receipt_hash(attachment.sha256, failed.id)
 
         assistant_text = (
             "No pude procesar el comprobante en este momento. "
             f"Codigo: {exc.code}. Detalle: {exc}"
         )
-        _create_message(db, conversation.id, "assistant", assistant_text, intent="analyze_receipt_error")
+        db.add(_build_message(conversation, "assistant", assistant_text, intent="analyze_receipt_error"))
+        db.commit()
 
         return ChatResponse(
             conversation_id=conversation.id,
@@ -392,21 +502,17 @@ def _process_message(
             data={"error_code": exc.code, "retriable": exc.retriable},
         )
 
+    _remember_receipt_hash(attachment.sha256, receipt.id)
     business_duplicate = _find_business_duplicate_candidate(db, receipt)
-    data = serialize_receipt(receipt, load_receipt_items(db, receipt.id))
+    items = load_receipt_items(db, receipt.id)
+    data = serialize_receipt(receipt, items)
 
     if business_duplicate:
         receipt.status = "duplicate_candidate"
         enriched_raw = dict(receipt.raw_json or {})
         enriched_raw["validation"] = dict(enriched_raw.get("validation") or {})
-        enriched_raw["validation"]["duplicate_candidate_of_receipt_id"] = business_duplicate.id
+        enriched_raw["validation"]["duplicate_candidate_of_receipt_id"] = str(business_duplicate.id)
         receipt.raw_json = enriched_raw
-        db.add(receipt)
-        db.commit()
-        db.refresh(receipt)
-
-        data = serialize_receipt(receipt, load_receipt_items(db, receipt.id))
-        data["duplicate_candidate_of_receipt_id"] = business_duplicate.id
 
     assistant_text = (
         f"Comprobante procesado. ID: {receipt.id}. "
@@ -417,7 +523,12 @@ def _process_message(
     if business_duplicate:
         assistant_text += f" Posible duplicado de negocio: {business_duplicate.id}."
 
-    _create_message(db, conversation.id, "assistant", assistant_text, intent="analyze_receipt")
+    db.add(_build_message(conversation, "assistant", assistant_text, intent="analyze_receipt"))
+    db.commit()
+
+    if business_duplicate:
+        data = serialize_receipt(receipt, items)
+        data["duplicate_candidate_of_receipt_id"] = business_duplicate.id
 
     return ChatResponse(
         conversation_id=conversation.id,
@@ -427,8 +538,8 @@ def _process_message(
     )
 
 
-def _sse(event: str, data: Any) -> str:
-    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+def _sse(event: str, data: Any) -> bytes:
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data, option=orjson.OPT_UTC_Z) + b"\n\n"
 
 
 @router.post("/message", response_model=ChatResponse)
@@ -437,10 +548,23 @@ async def send_message(
     message: str | None = Form(default=None),
     file: UploadFile | None = File(default=None),
     db: Session = Depends(get_db),
-) -> ChatResponse:
+    agent_client: AgentClient = Depends(get_agent_client),
+) -> APIJSONResponse:
     text = (message or "").strip()
+    parsed_conversation_id = _parse_conversation_id(conversation_id)
     payload = await _read_file_payload(file)
-    return _process_message(db=db, conversation_id=conversation_id, text=text, file_payload=payload)
+    try:
+        response = await _process_message(
+            db=db,
+            agent_client=agent_client,
+            conversation_id=parsed_conversation_id,
+            text=text,
+            file_payload=payload,
+        )
+    finally:
+        if payload is not None:
+            _discard_file(payload.temp_path)
+    return APIJSONResponse(response.model_dump())
 
 
 @router.post("/message/stream")
@@ -449,28 +573,36 @@ async def send_message_stream(
     message: str | None = Form(default=None),
     file: UploadFile | None = File(default=None),
     db: Session = Depends(get_db),
+    agent_client: AgentClient = Depends(get_agent_client),
 ) -> StreamingResponse:
     text = (message or "").strip()
+    parsed_conversation_id = _parse_conversation_id(conversation_id)
     payload = await _read_file_payload(file)
 
     async def event_stream() -> Any:
         yield _sse("start", {"status": "processing"})
 
         try:
-            response = _process_message(db=db, conversation_id=conversation_id, text=text, file_payload=payload)
+            response = await _process_message(
+                db=db,
+                agent_client=agent_client,
+                conversation_id=parsed_conversation_id,
+                text=text,
+                file_payload=payload,
+            )
         except HTTPException as exc:
             yield _sse("error", {"message": str(exc.detail), "status_code": exc.status_code})
             return
         except Exception as exc:  # noqa: BLE001
             yield _sse("error", {"message": f"Unexpected error: {exc}"})
             return
+        finally:
+            if payload is not None:
+                _discard_file(payload.temp_path)
 
         assistant_text = response.assistant_message or ""
-        if assistant_text:
-            for index in range(0, len(assistant_text), 24):
-                chunk = assistant_text[index : index + 24]
-                yield _sse("delta", {"content": chunk})
-                await asyncio.sleep(0.015)
+        for index in range(0, len(assistant_text), _STREAM_CHUNK_CHARS):
+            yield _sse("delta", {"content": assistant_text[index : index + _STREAM_CHUNK_CHARS]})
 
         yield _sse("final", response.model_dump())
 
@@ -484,13 +616,14 @@ async def send_message_stream(
 
 @router.get("/conversations/{conversation_id}/messages", response_model=list[MessageOut])
 def get_conversation_messages(conversation_id: str, db: Session = Depends(get_db)) -> list[MessageOut]:
-    conversation = db.query(Conversation).filter(Conversation.id == conversation_id).first()
+    parsed_id = parse_uuid(conversation_id)
+    conversation = db.get(Conversation, parsed_id) if parsed_id else None
     if not conversation:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Conversation no encontrada")
 
     messages = (
         db.query(Message)
-        .filter(Message.conversation_id == conversation_id)
+        .filter(Message.conversation_id == parsed_id)
         .order_by(Message.created_at.asc())
         .all()
     )
@@ -3,6 +3,7 @@ from datetime import date
 from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 
+from app.api.responses import APIJSONResponse
 from app.db import get_db
 from app.schemas import InsightAnomaliesOut, InsightSummaryOut, InsightTrendOut, InsightVendorsOut
 from app.services.insights_service import build_anomalies, build_summary, build_top_vendors, build_trend
@@ -15,8 +16,8 @@ def summary(
     from_date: date | None = Query(default=None, alias="from"),
     to_date: date | None = Query(default=None, alias="to"),
     db: Session = Depends(get_db),
-) -> InsightSummaryOut:
-    return InsightSummaryOut.model_validate(build_summary(db, from_date=from_date, to_date=to_date))
+) -> APIJSONResponse:
+    return APIJSONResponse(build_summary(db, from_date=from_date, to_date=to_date))
 
 
 @router.get("/vendors", response_model=InsightVendorsOut)
@@ -25,10 +26,8 @@ def vendors(
     from_date: date | None = Query(default=None, alias="from"),
     to_date: date | None = Query(default=None, alias="to"),
     db: Session = Depends(get_db),
-) -> InsightVendorsOut:
-    return InsightVendorsOut.model_validate(
-        build_top_vendors(db, limit=limit, from_date=from_date, to_date=to_date)
-    )
+) -> APIJSONResponse:
+    return APIJSONResponse(build_top_vendors(db, limit=limit, from_date=from_date, to_date=to_date))
 
 
 @router.get("/trend", response_model=InsightTrendOut)
@@ -37,10 +36,8 @@ def trend(
     from_date: date | None = Query(default=None, alias="from"),
     to_date: date | None = Query(default=None, alias="to"),
     db: Session = Depends(get_db),
-) -> InsightTrendOut:
-    return InsightTrendOut.model_validate(
-        build_trend(db, group_by=group_by, from_date=from_date, to_date=to_date)
-    )
+) -> APIJSONResponse:
+    return APIJSONResponse(build_trend(db, group_by=group_by, from_date=from_date, to_date=to_date))
 
 
 @router.get("/anomalies", response_model=InsightAnomaliesOut)
@@ -50,7 +47,5 @@ def anomalies(
     from_date: date | None = Query(default=None, alias="from"),
     to_date: date | None = Query(default=None, alias="to"),
     db: Session = Depends(get_db),
-) -> InsightAnomaliesOut:
-    return InsightAnomaliesOut.model_validate(
-        build_anomalies(db, factor=factor, limit=limit, from_date=from_date, to_date=to_date)
-    )
+) -> APIJSONResponse:
+    return APIJSONResponse(build_anomalies(db, factor=factor, limit=limit, from_date=from_date, to_date=to_date))
@@ -1,25 +1,54 @@
-from datetime import date
+import base64
+import uuid
+from datetime import date, datetime
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session, selectinload, undefer_group
 
+from app.api.responses import APIJSONResponse
 from app.db import get_db
 from app.models import Receipt
 from app.schemas import ReceiptListOut, ReceiptOut, ReceiptPatchIn
-from app.services.receipt_mapper import load_receipt_items, serialize_receipt
+from app.services.ids import parse_uuid
+from app.services.receipt_mapper import serialize_receipt
 
 router = APIRouter(prefix="/api/v1/receipts", tags=["receipts"])
 
 
-@router.get("/{receipt_id}", response_model=ReceiptOut)
-def get_receipt(receipt_id: str, db: Session = Depends(get_db)) -> ReceiptOut:
-    receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
+def _encode_cursor(receipt: Receipt) -> str:
+    raw = f"{receipt.created_at.isoformat()}|{receipt.id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    try:
+        created_at_raw, receipt_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at_raw), uuid.UUID(receipt_id)
+    except (ValueError, UnicodeError) as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cursor invalido") from exc
+
+
+def _get_receipt_or_404(db: Session, receipt_id: str) -> Receipt:
+    parsed_id = parse_uuid(receipt_id)
+    receipt = None
+    if parsed_id:
+        receipt = (
+            db.query(Receipt)
+            .options(selectinload(Receipt.items), undefer_group("payload"))
+            .filter(Receipt.id == parsed_id)
+            .first()
+        )
     if not receipt:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comprobante no encontrado")
+    return receipt
+
 
-    payload = serialize_receipt(receipt, load_receipt_items(db, receipt.id))
-    return ReceiptOut.model_validate(payload)
+@router.get("/{receipt_id}", response_model=ReceiptOut)
+def get_receipt(receipt_id: str, db: Session = Depends(get_db)) -> APIJSONResponse:
+    receipt = _get_receipt_or_404(db, receipt_id)
+
+    return APIJSONResponse(serialize_receipt(receipt, receipt.items))
 
 
 @router.get("", response_model=ReceiptListOut)
@@ -29,9 +58,10 @@ def list_receipts(
     max_total: float | None = Query(default=None, ge=0),
     from_date: date | None = Query(default=None, alias="from"),
     to_date: date | None = Query(default=None, alias="to"),
+    cursor: str | None = Query(default=None),
+    limit: int = Query(default=100, ge=1, le=100),
     db: Session = Depends(get_db),
-) -> ReceiptListOut:
-    query = db.query(Receipt)
+) -> APIJSONResponse:
     filters = []
 
     if vendor:
@@ -45,20 +75,30 @@ def list_receipts(
     if to_date:
         filters.append(Receipt.issue_date <= to_date)
 
-    if filters:
-        query = query.filter(and_(*filters))
-
-    receipts = query.order_by(Receipt.created_at.desc()).limit(100).all()
-    items = [ReceiptOut.model_validate(serialize_receipt(r, load_receipt_items(db, r.id))) for r in receipts]
-
-    return ReceiptListOut(total=len(items), items=items)
+    # Counted before the cursor predicate so total is the same on every page.
+    counted = select(Receipt.id, Receipt.created_at, func.count().over().label("matches")).where(*filters).subquery()
+    stmt = (
+        select(Receipt, counted.c.matches)
+        .join(counted, Receipt.id == counted.c.id)
+        .options(selectinload(Receipt.items), undefer_group("payload"))
+        .order_by(counted.c.created_at.desc(), counted.c.id.desc())
+        .limit(limit + 1)
+    )
+    if cursor:
+        stmt = stmt.where(tuple_(counted.c.created_at, counted.c.id) < tuple_(*_decode_cursor(cursor)))
+    rows = db.execute(stmt).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    total = rows[0].matches if rows else 0
+    items = [serialize_receipt(row.Receipt, row.Receipt.items) for row in rows]
+    next_cursor = _encode_cursor(rows[-1].Receipt) if has_more else None
+
+    return APIJSONResponse({"total": total, "items": items, "next_cursor": next_cursor})
 
 
 @router.patch("/{receipt_id}", response_model=ReceiptOut)
-def patch_receipt(receipt_id: str, payload: ReceiptPatchIn, db: Session = Depends(get_db)) -> ReceiptOut:
-    receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
-    if not receipt:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Comprobante no encontrado")
+def patch_receipt(receipt_id: str, payload: ReceiptPatchIn, db: Session = Depends(get_db)) -> APIJSONResponse:
+    receipt = _get_receipt_or_404(db, receipt_id)
 
     updates = payload.model_dump(exclude_unset=True)
     for field, value in updates.items():
@@ -66,6 +106,7 @@ def patch_receipt(receipt_id: str, payload: ReceiptPatchIn, db: Session = Depend
 
     db.add(receipt)
     db.commit()
-    db.refresh(receipt)
+    # Reload so amounts come back rounded by the Numeric(12, 2) columns; the rest is already current.
+    db.refresh(receipt, ["subtotal", "tax", "total"])
 
-    return ReceiptOut.model_validate(serialize_receipt(receipt, load_receipt_items(db, receipt.id)))
+    return APIJSONResponse(serialize_receipt(receipt, receipt.items))
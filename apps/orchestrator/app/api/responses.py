@@ -0,0 +1,10 @@
+from typing import Any
+
+import orjson
+from fastapi.responses import ORJSONResponse
+
+
+class APIJSONResponse(ORJSONResponse):
+    # Same wire format as the Pydantic response models: UTC timestamps end in "Z".
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
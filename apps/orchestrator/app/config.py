@@ -1,4 +1,4 @@
-from functools import lru_cache
+from functools import cached_property, lru_cache
 
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -17,20 +17,28 @@ class Settings(BaseSettings):
     agent_timeout_seconds: float = 25.0
     agent_retries: int = 2
     agent_backoff_seconds: float = 0.5
+    agent_max_connections: int = 64
+    agent_max_keepalive_connections: int = 32
+    agent_keepalive_expiry_seconds: float = 30.0
+
+    db_pool_size: int = 20
+    db_max_overflow: int = 20
+    db_pool_recycle_seconds: int = 1800
+    db_pool_timeout_seconds: float = 5.0
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
-    @property
+    @cached_property
     def cors_origins_list(self) -> list[str]:
         return [origin.strip() for origin in self.cors_origins.split(",") if origin.strip()]
 
-    @property
-    def allowed_mime_types_list(self) -> list[str]:
-        return [value.strip().lower() for value in self.allowed_mime_types.split(",") if value.strip()]
+    @cached_property
+    def allowed_mime_types_set(self) -> frozenset[str]:
+        return frozenset(value.strip().lower() for value in self.allowed_mime_types.split(",") if value.strip())
 
-    @property
-    def allowed_extensions_set(self) -> set[str]:
-        return {value.strip().lower() for value in self.allowed_extensions.split(",") if value.strip()}
+    @cached_property
+    def allowed_extensions_set(self) -> frozenset[str]:
+        return frozenset(value.strip().lower() for value in self.allowed_extensions.split(",") if value.strip())
 
 
 @lru_cache(maxsize=1)
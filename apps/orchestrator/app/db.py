@@ -1,18 +1,41 @@
+import logging
 from collections.abc import Generator
+from typing import Any
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, make_url, text
+from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import DeclarativeBase, Session, sessionmaker
 
 from app.config import get_settings
 
+logger = logging.getLogger(__name__)
+
 
 class Base(DeclarativeBase):
-    pass
+    __mapper_args__ = {"eager_defaults": True}
+
+
+def _driver_options(database_url: str) -> dict[str, Any]:
+    if make_url(database_url).get_driver_name() == "psycopg2":
+        return {"executemany_mode": "values_plus_batch", "executemany_batch_page_size": 500}
+    return {}
 
 
 settings = get_settings()
-engine = create_engine(settings.database_url, future=True, pool_pre_ping=True)
-SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, class_=Session)
+engine = create_engine(
+    settings.database_url,
+    future=True,
+    pool_pre_ping=True,
+    pool_size=settings.db_pool_size,
+    max_overflow=settings.db_max_overflow,
+    pool_recycle=settings.db_pool_recycle_seconds,
+    pool_timeout=settings.db_pool_timeout_seconds,
+    pool_use_lifo=True,
+    insertmanyvalues_page_size=1000,
+    query_cache_size=1200,
+    **_driver_options(settings.database_url),
+)
+SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, expire_on_commit=False, class_=Session)
 
 
 def init_db() -> None:
@@ -20,6 +43,29 @@ def init_db() -> None:
 
     Base.metadata.create_all(bind=engine)
 
+    # create_all skips tables that already exist, so indexes added to the models later are created here.
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=engine, checkfirst=True)
+
+    _create_trigram_indexes()
+
+
+def _create_trigram_indexes() -> None:
+    # Substring vendor search (ILIKE '%x%') can only use a trigram index. pg_trgm ships with the official
+    # postgres images, but it may be unavailable on managed instances; search still works without it.
+    try:
+        with engine.begin() as connection:
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+            connection.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_receipts_vendor_name_trgm "
+                    "ON receipts USING gin (vendor_name gin_trgm_ops)"
+                )
+            )
+    except SQLAlchemyError as exc:
+        logger.warning("Skipping trigram index on receipts.vendor_name: %s", exc)
+
 
 def get_db() -> Generator[Session, None, None]:
     db = SessionLocal()
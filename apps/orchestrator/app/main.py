@@ -3,17 +3,20 @@ import uuid
 
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import JSONResponse, Response
 from fastapi.exceptions import RequestValidationError
 
 from app.api.chat import router as chat_router
+from app.api.responses import APIJSONResponse
 from app.api.insights import router as insights_router
 from app.api.receipts import router as receipts_router
 from app.config import get_settings
 from app.db import init_db
+from app.services.agent_client import close_agent_client
 
 settings = get_settings()
-app = FastAPI(title=settings.app_name, version="0.2.0")
+app = FastAPI(title=settings.app_name, version="0.2.0", default_response_class=APIJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,6 +25,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
 
 
 @app.exception_handler(HTTPException)
@@ -74,9 +78,17 @@ def startup() -> None:
     init_db()
 
 
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await close_agent_client()
+
+
+_HEALTH_RESPONSE = Response(content=b'{"status":"ok"}', media_type="application/json")
+
+
 @app.get("/health")
-def health() -> dict[str, str]:
-    return {"status": "ok"}
+async def health() -> Response:
+    return _HEALTH_RESPONSE
 
 
 app.include_router(chat_router)
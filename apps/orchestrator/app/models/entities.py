@@ -1,9 +1,9 @@
 import uuid
 from datetime import date, datetime
 
-from sqlalchemy import Boolean, Date, DateTime, Float, ForeignKey, Numeric, String, Text
-from sqlalchemy.dialects.postgresql import JSONB
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Boolean, Date, DateTime, Float, ForeignKey, Index, Numeric, String, Text, text
+from sqlalchemy.dialects.postgresql import JSONB, UUID
+from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.sql import func
 
 from app.db import Base
@@ -12,39 +12,74 @@ from app.db import Base
 class Conversation(Base):
     __tablename__ = "conversations"
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (Index("ix_messages_conversation_created", "conversation_id", "created_at"),)
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    conversation_id: Mapped[str] = mapped_column(String(36), ForeignKey("conversations.id"), nullable=False, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    conversation_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=False, index=True)
     role: Mapped[str] = mapped_column(String(20), nullable=False)
     text: Mapped[str] = mapped_column(Text, nullable=False)
     intent: Mapped[str | None] = mapped_column(String(60), nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    # clock_timestamp() rather than now(): a user message and its reply are often written in one
+    # transaction, and now() would give them the same timestamp and an arbitrary history order.
+    created_at: Mapped[datetime] = mapped_column(
+        DateTime(timezone=True),
+        default=func.clock_timestamp(),
+        server_default=func.now(),
+        nullable=False,
+    )
+
+    conversation: Mapped[Conversation] = relationship()
 
 
 class Attachment(Base):
     __tablename__ = "attachments"
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    message_id: Mapped[str] = mapped_column(String(36), ForeignKey("messages.id"), nullable=False, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    message_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("messages.id"), nullable=False, index=True)
     filename: Mapped[str] = mapped_column(String(255), nullable=False)
     mime_type: Mapped[str] = mapped_column(String(120), nullable=False)
     storage_path: Mapped[str] = mapped_column(Text, nullable=False)
     sha256: Mapped[str] = mapped_column(String(64), nullable=False, index=True)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
+    message: Mapped[Message] = relationship()
+
 
 class Receipt(Base):
     __tablename__ = "receipts"
+    __table_args__ = (
+        Index("ix_receipts_number_date_total", "receipt_number", "issue_date", "total"),
+        Index("ix_receipts_created_at_id", "created_at", "id"),
+        Index(
+            "ix_receipts_raw_json_gin",
+            "raw_json",
+            postgresql_using="gin",
+            postgresql_ops={"raw_json": "jsonb_path_ops"},
+        ),
+        Index("ix_receipts_vendor_total", "vendor_name", postgresql_include=["total"]),
+        Index(
+            "ix_receipts_issue_date_total",
+            "issue_date",
+            postgresql_include=["total"],
+            postgresql_where=text("total IS NOT NULL"),
+        ),
+        # Must match build_trend's monthly expression; the ::timestamp cast keeps date_trunc immutable.
+        Index(
+            "ix_receipts_issue_month",
+            text("date_trunc('month', issue_date::timestamp)"),
+            postgresql_where=text("total IS NOT NULL"),
+        ),
+    )
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    attachment_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("attachments.id"), nullable=True, index=True)
-    conversation_id: Mapped[str] = mapped_column(String(36), ForeignKey("conversations.id"), nullable=False, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    attachment_id: Mapped[uuid.UUID | None] = mapped_column(UUID(as_uuid=True), ForeignKey("attachments.id"), nullable=True, index=True)
+    conversation_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("conversations.id"), nullable=False, index=True)
     vendor_name: Mapped[str] = mapped_column(String(255), nullable=False)
     vendor_tax_id: Mapped[str | None] = mapped_column(String(50), nullable=True)
     receipt_number: Mapped[str | None] = mapped_column(String(100), nullable=True, index=True)
@@ -56,8 +91,8 @@ class Receipt(Base):
     payment_method: Mapped[str | None] = mapped_column(String(50), nullable=True)
     confidence: Mapped[float | None] = mapped_column(Float, nullable=True)
     status: Mapped[str] = mapped_column(String(40), nullable=False, default="processed")
-    raw_text: Mapped[str | None] = mapped_column(Text, nullable=True)
-    raw_json: Mapped[dict | None] = mapped_column(JSONB, nullable=True)
+    raw_text: Mapped[str | None] = mapped_column(Text, nullable=True, deferred=True, deferred_group="payload")
+    raw_json: Mapped[dict | None] = mapped_column(JSONB, nullable=True, deferred=True, deferred_group="payload")
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     updated_at: Mapped[datetime] = mapped_column(
         DateTime(timezone=True),
@@ -66,23 +101,27 @@ class Receipt(Base):
         nullable=False,
     )
 
+    items: Mapped[list["ReceiptItem"]] = relationship(back_populates="receipt", lazy="raise")
+
 
 class ReceiptItem(Base):
     __tablename__ = "receipt_items"
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    receipt_id: Mapped[str] = mapped_column(String(36), ForeignKey("receipts.id"), nullable=False, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    receipt_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("receipts.id"), nullable=False, index=True)
     description: Mapped[str] = mapped_column(String(255), nullable=False)
     quantity: Mapped[float] = mapped_column(Numeric(12, 2), nullable=False, default=1)
     unit_price: Mapped[float | None] = mapped_column(Numeric(12, 2), nullable=True)
     line_total: Mapped[float | None] = mapped_column(Numeric(12, 2), nullable=True)
 
+    receipt: Mapped[Receipt] = relationship(back_populates="items", lazy="raise")
+
 
 class ExtractionRun(Base):
     __tablename__ = "extraction_runs"
 
-    id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    receipt_id: Mapped[str] = mapped_column(String(36), ForeignKey("receipts.id"), nullable=False, index=True)
+    id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    receipt_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("receipts.id"), nullable=False, index=True)
     provider: Mapped[str] = mapped_column(String(80), nullable=False)
     model: Mapped[str | None] = mapped_column(String(80), nullable=True)
     success: Mapped[bool] = mapped_column(Boolean, nullable=False, default=True)
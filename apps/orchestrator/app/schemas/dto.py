@@ -1,3 +1,4 @@
+import uuid
 from datetime import date, datetime
 from typing import Any
 
@@ -5,7 +6,7 @@ from pydantic import BaseModel, ConfigDict, Field
 
 
 class ReceiptItemOut(BaseModel):
-    id: str
+    id: uuid.UUID
     description: str
     quantity: float
     unit_price: float | None = None
@@ -15,9 +16,9 @@ class ReceiptItemOut(BaseModel):
 
 
 class ReceiptOut(BaseModel):
-    id: str
-    attachment_id: str | None = None
-    conversation_id: str
+    id: uuid.UUID
+    attachment_id: uuid.UUID | None = None
+    conversation_id: uuid.UUID
     vendor_name: str
     vendor_tax_id: str | None = None
     receipt_number: str | None = None
@@ -39,8 +40,8 @@ class ReceiptOut(BaseModel):
 
 
 class MessageOut(BaseModel):
-    id: str
-    conversation_id: str
+    id: uuid.UUID
+    conversation_id: uuid.UUID
     role: str
     text: str
     intent: str | None = None
@@ -50,9 +51,9 @@ class MessageOut(BaseModel):
 
 
 class ChatResponse(BaseModel):
-    conversation_id: str
+    conversation_id: uuid.UUID
     assistant_message: str
-    receipt_id: str | None = None
+    receipt_id: uuid.UUID | None = None
     data: Any | None = None
 
 
@@ -72,6 +73,7 @@ class ReceiptPatchIn(BaseModel):
 class ReceiptListOut(BaseModel):
     total: int
     items: list[ReceiptOut]
+    next_cursor: str | None = None
 
 
 class InsightSummaryOut(BaseModel):
@@ -104,7 +106,7 @@ class InsightTrendOut(BaseModel):
 
 
 class InsightAnomalyItemOut(BaseModel):
-    receipt_id: str
+    receipt_id: uuid.UUID
     vendor_name: str
     issue_date: date | None = None
     total: float
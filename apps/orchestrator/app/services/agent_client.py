@@ -1,11 +1,11 @@
-import base64
-import time
+import asyncio
 import uuid
 from typing import Any
 
 import httpx
+import orjson
 
-from app.config import get_settings
+from app.config import Settings, get_settings
 
 
 class AgentClientError(RuntimeError):
@@ -16,10 +16,21 @@ class AgentClientError(RuntimeError):
 
 
 class AgentClient:
-    def __init__(self) -> None:
-        self.settings = get_settings()
+    def __init__(self, settings: Settings | None = None) -> None:
+        self.settings = settings or get_settings()
+        self._client = httpx.AsyncClient(
+            timeout=max(self.settings.agent_timeout_seconds, 1),
+            limits=httpx.Limits(
+                max_connections=self.settings.agent_max_connections,
+                max_keepalive_connections=self.settings.agent_max_keepalive_connections,
+                keepalive_expiry=self.settings.agent_keepalive_expiry_seconds,
+            ),
+        )
 
-    def analyze_receipt(
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def analyze_receipt(
         self,
         *,
         file_bytes: bytes,
@@ -27,29 +38,28 @@ class AgentClient:
         mime_type: str,
         text_hint: str | None,
     ) -> dict[str, Any]:
-        payload = {
+        envelope = {
             "jsonrpc": "2.0",
             "id": str(uuid.uuid4()),
             "method": "analyze_receipt",
             "params": {
                 "filename": filename,
                 "mime_type": mime_type,
-                "content_base64": base64.b64encode(file_bytes).decode("utf-8"),
                 "text_hint": text_hint,
             },
         }
+        data = {"request": orjson.dumps(envelope).decode("utf-8")}
+        files = {"file": (filename, file_bytes, mime_type)}
 
         retries = max(self.settings.agent_retries, 0)
         backoff = max(self.settings.agent_backoff_seconds, 0)
-        timeout = max(self.settings.agent_timeout_seconds, 1)
 
         last_error: Exception | None = None
         for attempt in range(retries + 1):
             try:
-                with httpx.Client(timeout=timeout) as client:
-                    response = client.post(self.settings.agent_url, json=payload)
-                    response.raise_for_status()
-                    body = response.json()
+                response = await self._client.post(self.settings.agent_url, data=data, files=files)
+                response.raise_for_status()
+                body = response.json()
 
                 if body.get("error"):
                     error = body["error"]
@@ -66,7 +76,7 @@ class AgentClient:
             except httpx.TimeoutException as exc:
                 last_error = exc
                 if attempt < retries:
-                    time.sleep(backoff * (attempt + 1))
+                    await asyncio.sleep(backoff * (attempt + 1))
                     continue
                 raise AgentClientError(
                     "agent_timeout",
@@ -78,7 +88,7 @@ class AgentClient:
                 status_code = exc.response.status_code
                 retriable = status_code >= 500
                 if retriable and attempt < retries:
-                    time.sleep(backoff * (attempt + 1))
+                    await asyncio.sleep(backoff * (attempt + 1))
                     continue
                 raise AgentClientError(
                     "agent_http_error",
@@ -88,7 +98,7 @@ class AgentClient:
             except httpx.TransportError as exc:
                 last_error = exc
                 if attempt < retries:
-                    time.sleep(backoff * (attempt + 1))
+                    await asyncio.sleep(backoff * (attempt + 1))
                     continue
                 raise AgentClientError(
                     "agent_transport_error",
@@ -100,3 +110,21 @@ class AgentClient:
                 break
 
         raise AgentClientError("agent_unexpected_error", f"Unexpected analyzer error: {last_error}")
+
+
+_agent_client: AgentClient | None = None
+
+
+async def get_agent_client() -> AgentClient:
+    # Async so FastAPI does not run this dependency in the threadpool on every request.
+    global _agent_client
+    if _agent_client is None:
+        _agent_client = AgentClient(get_settings())
+    return _agent_client
+
+
+async def close_agent_client() -> None:
+    global _agent_client
+    if _agent_client is not None:
+        await _agent_client.aclose()
+        _agent_client = None
@@ -1,58 +1,58 @@
 from datetime import date
-from decimal import Decimal
 from typing import Any
 
-from sqlalchemy import and_, cast, func, String
+from sqlalchemy import cast, DateTime, func, Float, select, String, true
 from sqlalchemy.orm import Session
 
 from app.models import Receipt
 
 
-def _to_float(value: Decimal | float | int | None) -> float:
-    if value is None:
-        return 0.0
-    return float(value)
+def _as_float(expr: Any) -> Any:
+    return cast(func.coalesce(expr, 0), Float)
 
 
-def _base_filters(from_date: date | None = None, to_date: date | None = None) -> list[Any]:
-    filters: list[Any] = [Receipt.total.isnot(None)]
+def _base_filters(from_date: date | None = None, to_date: date | None = None) -> tuple[Any, ...]:
+    filters: tuple[Any, ...] = (Receipt.total.isnot(None),)
     if from_date:
-        filters.append(Receipt.issue_date >= from_date)
+        filters += (Receipt.issue_date >= from_date,)
     if to_date:
-        filters.append(Receipt.issue_date <= to_date)
+        filters += (Receipt.issue_date <= to_date,)
     return filters
 
 
 def build_summary(db: Session, from_date: date | None = None, to_date: date | None = None) -> dict[str, Any]:
     filters = _base_filters(from_date, to_date)
 
-    total_receipts, total_spent, average_ticket = (
-        db.query(
-            func.count(Receipt.id),
-            func.coalesce(func.sum(Receipt.total), 0),
-            func.coalesce(func.avg(Receipt.total), 0),
+    totals = (
+        select(
+            func.count(Receipt.id).label("total_receipts"),
+            _as_float(func.sum(Receipt.total)).label("total_spent"),
+            _as_float(func.avg(Receipt.total)).label("average_ticket"),
         )
-        .filter(and_(*filters))
-        .first()
+        .where(*filters)
+        .cte("totals")
     )
-
-    top_vendor_row = (
-        db.query(Receipt.vendor_name, func.coalesce(func.sum(Receipt.total), 0).label("vendor_total"))
-        .filter(and_(*(filters + [Receipt.vendor_name.isnot(None)])))
+    top_vendor = (
+        select(Receipt.vendor_name, _as_float(func.sum(Receipt.total)).label("vendor_total"))
+        .where(*filters, Receipt.vendor_name.isnot(None))
         .group_by(Receipt.vendor_name)
         .order_by(func.sum(Receipt.total).desc())
-        .first()
+        .limit(1)
+        .cte("top_vendor")
     )
-
-    top_vendor = top_vendor_row[0] if top_vendor_row else None
-    top_vendor_total = _to_float(top_vendor_row[1]) if top_vendor_row else None
+    # The outer join keeps the totals row when no vendor matches.
+    row = db.execute(
+        select(totals, top_vendor.c.vendor_name, top_vendor.c.vendor_total).select_from(
+            totals.outerjoin(top_vendor, true())
+        )
+    ).one()
 
     return {
-        "total_receipts": int(total_receipts or 0),
-        "total_spent": _to_float(total_spent),
-        "average_ticket": _to_float(average_ticket),
-        "top_vendor": top_vendor,
-        "top_vendor_total": top_vendor_total,
+        "total_receipts": int(row.total_receipts or 0),
+        "total_spent": row.total_spent,
+        "average_ticket": row.average_ticket,
+        "top_vendor": row.vendor_name,
+        "top_vendor_total": row.vendor_total,
     }
 
 
@@ -64,24 +64,25 @@ def build_top_vendors(
     to_date: date | None = None,
 ) -> dict[str, Any]:
     filters = _base_filters(from_date, to_date)
-    rows = (
-        db.query(
+    stmt = (
+        select(
             Receipt.vendor_name,
-            func.coalesce(func.sum(Receipt.total), 0).label("total_spent"),
+            _as_float(func.sum(Receipt.total)).label("total_spent"),
             func.count(Receipt.id).label("receipts_count"),
         )
-        .filter(and_(*(filters + [Receipt.vendor_name.isnot(None)])))
+        .where(*filters)
+        .where(Receipt.vendor_name.isnot(None))
         .group_by(Receipt.vendor_name)
         .order_by(func.sum(Receipt.total).desc())
         .limit(limit)
-        .all()
     )
+    rows = db.execute(stmt).all()
 
     return {
         "items": [
             {
                 "vendor_name": row[0],
-                "total_spent": _to_float(row[1]),
+                "total_spent": row[1],
                 "receipts_count": int(row[2]),
             }
             for row in rows
@@ -101,26 +102,28 @@ def build_trend(
     if group_by == "day":
         period_expr = cast(Receipt.issue_date, String)
     else:
-        period_expr = func.to_char(func.date_trunc("month", Receipt.issue_date), "YYYY-MM")
+        # Same expression as ix_receipts_issue_month.
+        period_expr = func.to_char(func.date_trunc("month", cast(Receipt.issue_date, DateTime)), "YYYY-MM")
 
-    rows = (
-        db.query(
+    stmt = (
+        select(
             period_expr.label("period"),
-            func.coalesce(func.sum(Receipt.total), 0).label("total_spent"),
+            _as_float(func.sum(Receipt.total)).label("total_spent"),
             func.count(Receipt.id).label("receipts_count"),
         )
-        .filter(and_(*(filters + [Receipt.issue_date.isnot(None)])))
+        .where(*filters)
+        .where(Receipt.issue_date.isnot(None))
         .group_by(period_expr)
         .order_by(period_expr.asc())
-        .all()
     )
+    rows = db.execute(stmt).all()
 
     return {
         "group_by": group_by,
         "items": [
             {
                 "period": str(row[0]),
-                "total_spent": _to_float(row[1]),
+                "total_spent": row[1],
                 "receipts_count": int(row[2]),
             }
             for row in rows
@@ -138,12 +141,7 @@ def build_anomalies(
 ) -> dict[str, Any]:
     filters = _base_filters(from_date, to_date)
 
-    avg_total = (
-        db.query(func.coalesce(func.avg(Receipt.total), 0))
-        .filter(and_(*filters))
-        .scalar()
-    )
-    average_ticket = _to_float(avg_total)
+    average_ticket = db.execute(select(_as_float(func.avg(Receipt.total))).where(*filters)).scalar_one()
     threshold = average_ticket * factor
 
     if threshold <= 0:
@@ -153,26 +151,27 @@ def build_anomalies(
             "items": [],
         }
 
-    rows = (
-        db.query(Receipt)
-        .filter(and_(*(filters + [Receipt.total >= threshold])))
+    stmt = (
+        select(Receipt.id, Receipt.vendor_name, Receipt.issue_date, cast(Receipt.total, Float).label("total"))
+        .where(*filters)
+        .where(Receipt.total >= threshold)
         .order_by(Receipt.total.desc())
         .limit(limit)
-        .all()
     )
+    rows = db.execute(stmt).mappings().all()
 
     return {
         "average_ticket": average_ticket,
         "threshold": threshold,
         "items": [
             {
-                "receipt_id": receipt.id,
-                "vendor_name": receipt.vendor_name,
-                "issue_date": receipt.issue_date,
-                "total": _to_float(receipt.total),
+                "receipt_id": row["id"],
+                "vendor_name": row["vendor_name"],
+                "issue_date": row["issue_date"],
+                "total": row["total"],
                 "threshold": threshold,
                 "reason": "total_above_dynamic_threshold",
             }
-            for receipt in rows
+            for row in rows
         ],
     }
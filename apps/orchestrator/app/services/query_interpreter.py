@@ -1,14 +1,15 @@
 import re
+from collections.abc import Callable
 from datetime import date
-from decimal import Decimal
 from typing import Any
 
-from sqlalchemy import and_
-from sqlalchemy.orm import Session
+from sqlalchemy import and_, func
+from sqlalchemy.orm import Session, raiseload, selectinload, undefer_group
 
 from app.models import Receipt
+from app.services.ids import parse_uuid
 from app.services.insights_service import build_anomalies, build_summary, build_top_vendors, build_trend
-from app.services.receipt_mapper import load_receipt_items, serialize_receipt
+from app.services.receipt_mapper import load_receipt_items_bulk, serialize_receipt
 
 
 HELP_TEXT = (
@@ -19,6 +20,11 @@ HELP_TEXT = (
     "4) 'top proveedores', 'tendencia mensual' o 'anomalias'"
 )
 
+_AMOUNT_RE = re.compile(r"(\d+[\.,]?\d*)")
+_UUID_RE = re.compile(r"([0-9a-fA-F]{8}-[0-9a-fA-F-]{27})")
+_RECEIPT_REF_RE = re.compile(r"comprobante\s+([A-Za-z0-9-]+)")
+_VENDOR_RE = re.compile(r"proveedor\s+([a-zA-Z0-9\s]+)", re.IGNORECASE)
+
 
 class QueryResult:
     def __init__(self, message: str, data: Any = None) -> None:
@@ -26,14 +32,8 @@ class QueryResult:
         self.data = data
 
 
-def _to_float(value: Decimal | float | int | None) -> float:
-    if value is None:
-        return 0.0
-    return float(value)
-
-
 def _parse_amount(text: str) -> float | None:
-    match = re.search(r"(\d+[\.,]?\d*)", text)
+    match = _AMOUNT_RE.search(text)
     if not match:
         return None
     normalized = match.group(1).replace(",", ".")
@@ -44,11 +44,11 @@ def _parse_amount(text: str) -> float | None:
 
 
 def _parse_receipt_id(text: str) -> str | None:
-    match = re.search(r"([0-9a-fA-F]{8}-[0-9a-fA-F-]{27})", text)
+    match = _UUID_RE.search(text)
     if match:
         return match.group(1)
 
-    simple = re.search(r"comprobante\s+([A-Za-z0-9-]+)", text)
+    simple = _RECEIPT_REF_RE.search(text)
     if simple:
         return simple.group(1)
 
@@ -61,77 +61,102 @@ def handle_text_query(db: Session, text: str) -> QueryResult:
     if not normalized:
         return QueryResult("Envia un mensaje o un archivo para continuar.")
 
-    if "resumen" in normalized or "insight" in normalized:
-        return _build_summary(db)
+    for matches, handler in _INTENTS:
+        if matches(normalized):
+            return handler(db, text, normalized)
 
-    if "top" in normalized and ("proveedor" in normalized or "vendor" in normalized):
-        top = build_top_vendors(db, limit=5)
-        if not top["items"]:
-            return QueryResult("No hay suficientes datos para top proveedores.", top)
+    return QueryResult(HELP_TEXT)
 
-        first = top["items"][0]
-        message = (
-            f"Top proveedores listo. #1 {first['vendor_name']} con {first['total_spent']:.2f}."
-        )
-        return QueryResult(message, top)
 
-    if "tendencia" in normalized or "trend" in normalized:
-        group_by = "day" if "dia" in normalized else "month"
-        trend = build_trend(db, group_by=group_by)
-        if not trend["items"]:
-            return QueryResult("No hay suficientes datos para tendencia.", trend)
+def _handle_top_vendors(db: Session, text: str, normalized: str) -> QueryResult:
+    top = build_top_vendors(db, limit=5)
+    if not top["items"]:
+        return QueryResult("No hay suficientes datos para top proveedores.", top)
 
-        message = f"Tendencia {group_by} generada con {len(trend['items'])} puntos."
-        return QueryResult(message, trend)
+    first = top["items"][0]
+    message = (
+        f"Top proveedores listo. #1 {first['vendor_name']} con {first['total_spent']:.2f}."
+    )
+    return QueryResult(message, top)
 
-    if "anomalia" in normalized or "anomal" in normalized:
-        anomalies = build_anomalies(db, factor=1.8, limit=10)
-        if not anomalies["items"]:
-            return QueryResult("No detecte anomalias con el umbral actual.", anomalies)
 
-        message = (
-            f"Detecte {len(anomalies['items'])} anomalias sobre umbral {anomalies['threshold']:.2f}."
-        )
-        return QueryResult(message, anomalies)
+def _handle_trend(db: Session, text: str, normalized: str) -> QueryResult:
+    group_by = "day" if "dia" in normalized else "month"
+    trend = build_trend(db, group_by=group_by)
+    if not trend["items"]:
+        return QueryResult("No hay suficientes datos para tendencia.", trend)
 
-    if "comprobante" in normalized and "buscar" not in normalized:
-        receipt_id = _parse_receipt_id(text)
-        if not receipt_id:
-            return QueryResult("No pude detectar un ID. Usa: comprobante <id>")
+    message = f"Tendencia {group_by} generada con {len(trend['items'])} puntos."
+    return QueryResult(message, trend)
 
-        receipt = db.query(Receipt).filter(Receipt.id == receipt_id).first()
-        if not receipt:
-            return QueryResult(f"No encontre el comprobante {receipt_id}.")
 
-        payload = serialize_receipt(receipt, load_receipt_items(db, receipt.id))
-        return QueryResult(
-            f"Encontre el comprobante {receipt.id} por {payload['total']} {payload['currency']}.",
-            payload,
-        )
+def _handle_anomalies(db: Session, text: str, normalized: str) -> QueryResult:
+    anomalies = build_anomalies(db, factor=1.8, limit=10)
+    if not anomalies["items"]:
+        return QueryResult("No detecte anomalias con el umbral actual.", anomalies)
 
-    if "buscar" in normalized or "mayor" in normalized or ">" in normalized:
-        amount = _parse_amount(normalized)
-        if amount is None:
-            amount = 0.0
+    message = (
+        f"Detecte {len(anomalies['items'])} anomalias sobre umbral {anomalies['threshold']:.2f}."
+    )
+    return QueryResult(message, anomalies)
+
+
+def _handle_receipt_lookup(db: Session, text: str, normalized: str) -> QueryResult:
+    receipt_id = _parse_receipt_id(text)
+    if not receipt_id:
+        return QueryResult("No pude detectar un ID. Usa: comprobante <id>")
+
+    parsed_id = parse_uuid(receipt_id)
+    receipt = None
+    if parsed_id:
+        receipt = (
+            db.query(Receipt)
+            .options(selectinload(Receipt.items), undefer_group("payload"))
+            .filter(Receipt.id == parsed_id)
+            .first()
+        )
+    if not receipt:
+        return QueryResult(f"No encontre el comprobante {receipt_id}.")
 
-        vendor_match = re.search(r"proveedor\s+([a-zA-Z0-9\s]+)", text, re.IGNORECASE)
-        query = db.query(Receipt)
-        filters = [Receipt.total.isnot(None), Receipt.total >= amount]
-        if vendor_match:
-            vendor = vendor_match.group(1).strip()
-            filters.append(Receipt.vendor_name.ilike(f"%{vendor}%"))
+    payload = serialize_receipt(receipt, receipt.items)
+    return QueryResult(
+        f"Encontre el comprobante {receipt.id} por {payload['total']} {payload['currency']}.",
+        payload,
+    )
 
-        receipts = query.filter(and_(*filters)).order_by(Receipt.created_at.desc()).limit(20).all()
-        if not receipts:
-            return QueryResult(f"No encontre comprobantes con total >= {amount:.2f}.")
 
-        data = [serialize_receipt(r, load_receipt_items(db, r.id)) for r in receipts]
-        return QueryResult(f"Encontre {len(data)} comprobantes con total >= {amount:.2f}.", data)
+def _handle_search(db: Session, text: str, normalized: str) -> QueryResult:
+    amount = _parse_amount(normalized)
+    if amount is None:
+        amount = 0.0
 
-    return QueryResult(HELP_TEXT)
+    vendor_match = _VENDOR_RE.search(text)
+    query = db.query(Receipt, func.count().over().label("matches")).options(
+        undefer_group("payload"), raiseload("*")
+    )
+    filters = [Receipt.total.isnot(None), Receipt.total >= amount]
+    if vendor_match:
+        vendor = vendor_match.group(1).strip()
+        filters.append(Receipt.vendor_name.ilike(f"%{vendor}%"))
+
+    rows = (
+        query.filter(and_(*filters))
+        .order_by(Receipt.created_at.desc(), Receipt.id.desc())
+        .limit(20)
+        .all()
+    )
+    if not rows:
+        return QueryResult(f"No encontre comprobantes con total >= {amount:.2f}.")
+
+    items_by_receipt = load_receipt_items_bulk(db, [row.Receipt.id for row in rows])
+    data = [serialize_receipt(row.Receipt, items_by_receipt.get(row.Receipt.id, [])) for row in rows]
+    message = f"Encontre {rows[0].matches} comprobantes con total >= {amount:.2f}."
+    if rows[0].matches > len(data):
+        message += f" Mostrando los {len(data)} mas recientes."
+    return QueryResult(message, data)
 
 
-def _build_summary(db: Session) -> QueryResult:
+def _handle_summary(db: Session, text: str, normalized: str) -> QueryResult:
     data = build_summary(db)
     data["generated_at"] = date.today().isoformat()
 
@@ -140,6 +165,17 @@ def _build_summary(db: Session) -> QueryResult:
         f"ticket promedio {data['average_ticket']:.2f}."
     )
     if data.get("top_vendor"):
-        message += f" Proveedor con mayor gasto: {data['top_vendor']} ({_to_float(data['top_vendor_total']):.2f})."
+        message += f" Proveedor con mayor gasto: {data['top_vendor']} ({data['top_vendor_total']:.2f})."
 
     return QueryResult(message, data)
+
+
+# Checked in order against the lowercased message; substring matches keep plurals like "proveedores" working.
+_INTENTS: tuple[tuple[Callable[[str], bool], Callable[[Session, str, str], QueryResult]], ...] = (
+    (lambda n: "resumen" in n or "insight" in n, _handle_summary),
+    (lambda n: "top" in n and ("proveedor" in n or "vendor" in n), _handle_top_vendors),
+    (lambda n: "tendencia" in n or "trend" in n, _handle_trend),
+    (lambda n: "anomal" in n, _handle_anomalies),
+    (lambda n: "comprobante" in n and "buscar" not in n, _handle_receipt_lookup),
+    (lambda n: "buscar" in n or "mayor" in n or ">" in n, _handle_search),
+)
@@ -1,4 +1,5 @@
-from decimal import Decimal
+import uuid
+from collections import defaultdict
 from typing import Any
 
 from sqlalchemy.orm import Session
@@ -6,24 +7,22 @@ from sqlalchemy.orm import Session
 from app.models import Receipt, ReceiptItem
 
 
-def _to_float(value: Any) -> float | None:
-    if value is None:
-        return None
-    if isinstance(value, Decimal):
-        return float(value)
-    if isinstance(value, (int, float)):
-        return float(value)
-    try:
-        return float(value)
-    except (TypeError, ValueError):
-        return None
+def load_receipt_items(db: Session, receipt_id: uuid.UUID) -> list[ReceiptItem]:
+    return db.query(ReceiptItem).filter(ReceiptItem.receipt_id == receipt_id).all()
 
 
-def load_receipt_items(db: Session, receipt_id: str) -> list[ReceiptItem]:
-    return db.query(ReceiptItem).filter(ReceiptItem.receipt_id == receipt_id).all()
+def load_receipt_items_bulk(db: Session, receipt_ids: list[uuid.UUID]) -> dict[uuid.UUID, list[ReceiptItem]]:
+    grouped: dict[uuid.UUID, list[ReceiptItem]] = defaultdict(list)
+    if not receipt_ids:
+        return grouped
+
+    for item in db.query(ReceiptItem).filter(ReceiptItem.receipt_id.in_(receipt_ids)):
+        grouped[item.receipt_id].append(item)
+    return grouped
 
 
 def serialize_receipt(receipt: Receipt, items: list[ReceiptItem]) -> dict[str, Any]:
+    # orjson encodes dates natively but not Decimal, so only the Numeric columns are converted.
     return {
         "id": receipt.id,
         "attachment_id": receipt.attachment_id,
@@ -31,25 +30,25 @@ def serialize_receipt(receipt: Receipt, items: list[ReceiptItem]) -> dict[str, A
         "vendor_name": receipt.vendor_name,
         "vendor_tax_id": receipt.vendor_tax_id,
         "receipt_number": receipt.receipt_number,
-        "issue_date": receipt.issue_date.isoformat() if receipt.issue_date else None,
+        "issue_date": receipt.issue_date,
         "currency": receipt.currency,
-        "subtotal": _to_float(receipt.subtotal),
-        "tax": _to_float(receipt.tax),
-        "total": _to_float(receipt.total),
+        "subtotal": float(receipt.subtotal) if receipt.subtotal is not None else None,
+        "tax": float(receipt.tax) if receipt.tax is not None else None,
+        "total": float(receipt.total) if receipt.total is not None else None,
         "payment_method": receipt.payment_method,
         "confidence": receipt.confidence,
         "status": receipt.status,
         "raw_text": receipt.raw_text,
         "raw_json": receipt.raw_json,
-        "created_at": receipt.created_at.isoformat() if receipt.created_at else None,
-        "updated_at": receipt.updated_at.isoformat() if receipt.updated_at else None,
+        "created_at": receipt.created_at,
+        "updated_at": receipt.updated_at,
         "items": [
             {
                 "id": item.id,
                 "description": item.description,
-                "quantity": _to_float(item.quantity) or 0.0,
-                "unit_price": _to_float(item.unit_price),
-                "line_total": _to_float(item.line_total),
+                "quantity": float(item.quantity) if item.quantity is not None else 0.0,
+                "unit_price": float(item.unit_price) if item.unit_price is not None else None,
+                "line_total": float(item.line_total) if item.line_total is not None else None,
             }
             for item in items
         ],
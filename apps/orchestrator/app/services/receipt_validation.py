@@ -1,4 +1,6 @@
+import math
 from datetime import date
+from enum import IntFlag
 from pathlib import Path
 from typing import Any
 
@@ -9,6 +11,16 @@ from app.config import Settings
 VALID_CURRENCIES = {"PEN", "USD", "EUR", "COP", "MXN", "CLP", "ARS", "BRL"}
 
 
+class ReceiptWarning(IntFlag):
+    # Member names are the warning codes stored in raw_json; definition order is the reporting order.
+    vendor_name_too_short = 1
+    currency_outside_allowlist = 2
+    total_missing_or_non_positive = 4
+    amount_inconsistency_subtotal_tax_total = 8
+    issue_date_in_future = 16
+    issue_date_invalid = 32
+
+
 def validate_upload(*, filename: str, mime_type: str, size_bytes: int, settings: Settings) -> None:
     extension = Path(filename).suffix.lower()
     mime_normalized = (mime_type or "").lower()
@@ -28,7 +40,7 @@ def validate_upload(*, filename: str, mime_type: str, size_bytes: int, settings:
             detail=f"Extension no permitida: {extension or 'sin extension'}",
         )
 
-    if mime_normalized and mime_normalized not in settings.allowed_mime_types_list:
+    if mime_normalized and mime_normalized not in settings.allowed_mime_types_set:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=f"MIME no permitido: {mime_normalized}",
@@ -46,36 +58,44 @@ def _to_float(value: Any) -> float | None:
 
 def validate_receipt_payload(receipt_payload: dict[str, Any]) -> tuple[dict[str, Any], list[str], str]:
     payload = dict(receipt_payload)
-    warnings: list[str] = []
+    flags = ReceiptWarning(0)
+    today = date.today()
 
     vendor_name = str(payload.get("vendor_name") or "").strip()
     if len(vendor_name) < 3:
-        warnings.append("vendor_name_too_short")
+        flags |= ReceiptWarning.vendor_name_too_short
 
     currency = str(payload.get("currency") or "PEN").upper().strip()
     payload["currency"] = currency
     if currency not in VALID_CURRENCIES:
-        warnings.append("currency_outside_allowlist")
+        flags |= ReceiptWarning.currency_outside_allowlist
 
     subtotal = _to_float(payload.get("subtotal"))
     tax = _to_float(payload.get("tax"))
     total = _to_float(payload.get("total"))
 
     if total is None or total <= 0:
-        warnings.append("total_missing_or_non_positive")
+        flags |= ReceiptWarning.total_missing_or_non_positive
 
     if subtotal is not None and tax is not None and total is not None:
-        if abs((subtotal + tax) - total) > 1.0:
-            warnings.append("amount_inconsistency_subtotal_tax_total")
+        if not math.isclose(subtotal + tax, total, rel_tol=0.0, abs_tol=1.0):
+            flags |= ReceiptWarning.amount_inconsistency_subtotal_tax_total
 
     issue_date_raw = payload.get("issue_date")
-    if issue_date_raw:
+    parsed_date = None
+    if isinstance(issue_date_raw, date):
+        parsed_date = issue_date_raw
+    elif isinstance(issue_date_raw, str) and issue_date_raw:
         try:
-            parsed_date = date.fromisoformat(str(issue_date_raw))
-            if parsed_date > date.today():
-                warnings.append("issue_date_in_future")
+            parsed_date = date.fromisoformat(issue_date_raw)
         except ValueError:
-            warnings.append("issue_date_invalid")
-
-    status_value = "processed" if not warnings else "processed_with_warnings"
-    return payload, warnings, status_value
+            pass
+    if parsed_date is None:
+        if issue_date_raw:
+            flags |= ReceiptWarning.issue_date_invalid
+    elif parsed_date > today:
+        flags |= ReceiptWarning.issue_date_in_future
+    payload["issue_date"] = parsed_date
+
+    status_value = "processed_with_warnings" if flags else "processed"
+    return payload, [warning.name for warning in flags], status_value
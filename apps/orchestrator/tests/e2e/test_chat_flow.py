@@ -1,123 +1,271 @@
-import json
+import itertools
 import os
-import uuid
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any, NamedTuple
 
+import orjson
+import pytest
 import requests
+from filelock import FileLock
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 
 API_BASE_URL = os.getenv("API_BASE_URL", "http://localhost:8000")
 API_TIMEOUT = float(os.getenv("API_TIMEOUT", "30"))
+UPLOAD_DIR = os.getenv("UPLOAD_DIR")
 
+_SSE_EVENT = b"event:"
+_SSE_DATA = b"data:"
 
-def _post_chat_message(message: str | None, file_path: Path | None, conversation_id: str | None = None) -> dict:
+# Seeded from the clock so runs against the same database still upload content the server has not seen.
+_COUNTER = itertools.count(time.time_ns())
+_RECEIPT_HEADER = b"TIENDA QA SAC\nFACTURA: F001-"
+_RECEIPT_FOOTER = b"\nFECHA: 2026-02-23\nTOTAL: 480.75\nMETODO: TARJETA"
+
+
+class SeededReceipt(NamedTuple):
+    conversation_id: str
+    receipt_id: str
+    receipt_file: Path
+    file_tuple: tuple[str, bytes, str]
+
+
+@pytest.fixture(scope="session")
+def http() -> Iterator[requests.Session]:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=Retry(total=0), pool_block=False)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    yield session
+    session.close()
+
+
+def _json(response: requests.Response) -> Any:
+    return orjson.loads(response.content)
+
+
+def _post_chat_message(
+    http: requests.Session,
+    message: str | None,
+    conversation_id: str | None = None,
+    file_tuple: tuple[str, bytes, str] | None = None,
+) -> dict:
     data: dict[str, str] = {}
     if conversation_id:
         data["conversation_id"] = conversation_id
     if message:
         data["message"] = message
 
-    files = None
-    if file_path is not None:
-        files = {
-            "file": (file_path.name, file_path.read_bytes(), "text/plain"),
-        }
+    files = {"file": file_tuple} if file_tuple is not None else None
 
-    response = requests.post(
+    response = http.post(
         f"{API_BASE_URL}/api/v1/chat/message",
         data=data,
         files=files,
         timeout=API_TIMEOUT,
     )
     assert response.status_code == 200, response.text
-    return response.json()
+    return _json(response)
 
 
 def _collect_sse_events(response: requests.Response) -> list[dict[str, str]]:
     events: list[dict[str, str]] = []
-    current_event = "message"
-    data_lines: list[str] = []
-
-    for raw_line in response.iter_lines(decode_unicode=True):
-        if raw_line is None:
-            continue
-
-        line = raw_line.strip("\r")
-        if line == "":
-            if data_lines:
-                events.append({"event": current_event, "data": "\n".join(data_lines)})
-                if current_event == "final":
+    parser_event: dict[str, Any] = {"event": "message", "data": []}
+    buffer = bytearray()
+
+    def dispatch() -> bool:
+        emitted_final = False
+        if parser_event["data"]:
+            events.append(
+                {
+                    "event": parser_event["event"],
+                    "data": b"\n".join(parser_event["data"]).decode("utf-8"),
+                }
+            )
+            emitted_final = parser_event["event"] == "final"
+        parser_event["event"] = "message"
+        parser_event["data"].clear()
+        return emitted_final
+
+    for chunk in response.iter_content(chunk_size=8192):
+        buffer.extend(chunk)
+        while (newline := buffer.find(b"\n")) != -1:
+            line = bytes(buffer[:newline]).rstrip(b"\r")
+            del buffer[: newline + 1]
+
+            if not line:
+                if dispatch():
+                    response.close()
                     return events
-            current_event = "message"
-            data_lines = []
-            continue
-
-        if line.startswith("event:"):
-            current_event = line.split(":", 1)[1].strip()
-            continue
-
-        if line.startswith("data:"):
-            data_lines.append(line.split(":", 1)[1].lstrip())
-
+                continue
+
+            # Per the SSE spec a single space after the colon is not part of the value.
+            if line.startswith(_SSE_EVENT):
+                value = line[len(_SSE_EVENT) :]
+                if value.startswith(b" "):
+                    value = value[1:]
+                parser_event["event"] = value.decode("utf-8")
+                continue
+
+            if line.startswith(_SSE_DATA):
+                value = line[len(_SSE_DATA) :]
+                if value.startswith(b" "):
+                    value = value[1:]
+                parser_event["data"].append(value)
+
+    dispatch()
     return events
 
 
-def test_end_to_end_upload_query_and_duplicate_detection(tmp_path: Path) -> None:
-    unique_tag = uuid.uuid4().hex[:8]
-    receipt_file = tmp_path / f"receipt-{unique_tag}.txt"
-    receipt_file.write_text(
-        "\n".join(
-            [
-                "TIENDA QA SAC",
-                f"FACTURA: F001-{unique_tag}",
-                "FECHA: 2026-02-23",
-                "TOTAL: 480.75",
-                "METODO: TARJETA",
-            ]
-        ),
-        encoding="utf-8",
-    )
+def _upload_seeded_receipt(http: requests.Session, directory: Path) -> SeededReceipt:
+    unique_tag = f"{next(_COUNTER):08x}"
+    receipt_file = directory / f"receipt-{unique_tag}.txt"
+    receipt_bytes = b"".join((_RECEIPT_HEADER, unique_tag.encode("ascii"), _RECEIPT_FOOTER))
+    receipt_file.write_bytes(receipt_bytes)
+    file_tuple = (receipt_file.name, receipt_bytes, "text/plain")
 
-    first = _post_chat_message(message="Procesa este comprobante", file_path=receipt_file)
+    first = _post_chat_message(http, message="Procesa este comprobante", file_tuple=file_tuple)
     conversation_id = first.get("conversation_id")
     receipt_id = first.get("receipt_id")
 
     assert conversation_id
     assert receipt_id
     assert "Comprobante procesado" in first.get("assistant_message", "")
-
-    get_receipt = requests.get(f"{API_BASE_URL}/api/v1/receipts/{receipt_id}", timeout=API_TIMEOUT)
+    return SeededReceipt(conversation_id, receipt_id, receipt_file, file_tuple)
+
+
+@pytest.fixture(scope="session")
+def seeded_receipt(
+    http: requests.Session,
+    tmp_path_factory: pytest.TempPathFactory,
+    worker_id: str,
+) -> SeededReceipt:
+    if worker_id == "master":
+        return _upload_seeded_receipt(http, tmp_path_factory.mktemp("receipts"))
+
+    # Each xdist worker has its own session; the first one uploads and the rest read its ids.
+    shared_dir = tmp_path_factory.getbasetemp().parent
+    state_file = shared_dir / "seeded_receipt.json"
+    with FileLock(f"{state_file}.lock"):
+        if state_file.is_file():
+            state = orjson.loads(state_file.read_bytes())
+            receipt_file = Path(state["receipt_file"])
+            file_tuple = (receipt_file.name, receipt_file.read_bytes(), "text/plain")
+            return SeededReceipt(state["conversation_id"], state["receipt_id"], receipt_file, file_tuple)
+
+        seeded = _upload_seeded_receipt(http, shared_dir)
+        state_file.write_bytes(
+            orjson.dumps(
+                {
+                    "conversation_id": seeded.conversation_id,
+                    "receipt_id": seeded.receipt_id,
+                    "receipt_file": str(seeded.receipt_file),
+                }
+            )
+        )
+        return seeded
+
+
+def test_receipt_get(http: requests.Session, seeded_receipt: SeededReceipt) -> None:
+    get_receipt = http.get(f"{API_BASE_URL}/api/v1/receipts/{seeded_receipt.receipt_id}", timeout=API_TIMEOUT)
     assert get_receipt.status_code == 200, get_receipt.text
 
-    receipt_payload = get_receipt.json()
-    assert receipt_payload["id"] == receipt_id
+    receipt_payload = _json(get_receipt)
+    assert receipt_payload["id"] == seeded_receipt.receipt_id
     assert receipt_payload["total"] is not None
 
-    query_by_id = _post_chat_message(message=f"comprobante {receipt_id}", file_path=None, conversation_id=conversation_id)
-    assert "Encontre" in query_by_id.get("assistant_message", "")
 
-    query_search = _post_chat_message(
-        message="buscar comprobantes mayor a 200",
-        file_path=None,
-        conversation_id=conversation_id,
+@pytest.fixture(scope="module")
+def seeded_queries(http: requests.Session, seeded_receipt: SeededReceipt) -> dict[str, dict]:
+    messages = {
+        "by_id": f"comprobante {seeded_receipt.receipt_id}",
+        "search": "buscar comprobantes mayor a 200",
+    }
+    with ThreadPoolExecutor(max_workers=len(messages)) as executor:
+        futures = {
+            name: executor.submit(_post_chat_message, http, message, seeded_receipt.conversation_id)
+            for name, message in messages.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def test_query_by_id(seeded_queries: dict[str, dict]) -> None:
+    assert "Encontre" in seeded_queries["by_id"].get("assistant_message", "")
+
+
+def test_search(seeded_queries: dict[str, dict]) -> None:
+    assert "Encontre" in seeded_queries["search"].get("assistant_message", "")
+
+
+@pytest.fixture(scope="module")
+def duplicate_receipt(http: requests.Session, seeded_receipt: SeededReceipt) -> dict:
+    # A copy of the seeded receipt that only the PATCH test edits.
+    return _post_chat_message(
+        http,
+        message="Mismo archivo otra vez",
+        file_tuple=seeded_receipt.file_tuple,
+        conversation_id=seeded_receipt.conversation_id,
     )
-    assert "Encontre" in query_search.get("assistant_message", "")
 
-    second = _post_chat_message(message="Mismo archivo otra vez", file_path=receipt_file, conversation_id=conversation_id)
+
+@pytest.mark.xdist_group("mutating")
+def test_duplicate_detection(http: requests.Session, seeded_receipt: SeededReceipt, duplicate_receipt: dict) -> None:
+    second = duplicate_receipt
     assert second.get("receipt_id")
-    assert second["receipt_id"] != receipt_id
+    assert second["receipt_id"] != seeded_receipt.receipt_id
     assert "duplicado" in second.get("assistant_message", "").lower()
-    assert second.get("data", {}).get("duplicate_of_receipt_id") == receipt_id
+    assert second.get("data", {}).get("duplicate_of_receipt_id") == seeded_receipt.receipt_id
 
-    insights = requests.get(f"{API_BASE_URL}/api/v1/insights/summary", timeout=API_TIMEOUT)
+    insights = http.get(f"{API_BASE_URL}/api/v1/insights/summary", timeout=API_TIMEOUT)
     assert insights.status_code == 200, insights.text
-    insights_payload = insights.json()
+    insights_payload = _json(insights)
     assert insights_payload["total_receipts"] >= 2
     assert insights_payload["total_spent"] > 0
 
 
-def test_streaming_endpoint_emits_final_event() -> None:
-    response = requests.post(
+@pytest.mark.xdist_group("mutating")
+@pytest.mark.usefixtures("duplicate_receipt")
+def test_receipt_list_pagination(http: requests.Session) -> None:
+    first = http.get(f"{API_BASE_URL}/api/v1/receipts", params={"limit": 1}, timeout=API_TIMEOUT)
+    assert first.status_code == 200, first.text
+    total = _json(first)["total"]
+    assert total >= 2
+
+    page_size = min(100, (total + 1) // 2)
+    seen: list[str] = []
+    pages = 0
+    cursor = None
+    while True:
+        pages += 1
+        params: dict[str, Any] = {"limit": page_size}
+        if cursor:
+            params["cursor"] = cursor
+        page = http.get(f"{API_BASE_URL}/api/v1/receipts", params=params, timeout=API_TIMEOUT)
+        assert page.status_code == 200, page.text
+
+        body = _json(page)
+        assert body["total"] == total
+        seen.extend(item["id"] for item in body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+        assert len(body["items"]) == page_size
+
+    assert pages >= 2
+    assert len(seen) == total
+    assert len(set(seen)) == total
+
+    malformed = http.get(f"{API_BASE_URL}/api/v1/receipts", params={"cursor": "not-a-cursor"}, timeout=API_TIMEOUT)
+    assert malformed.status_code == 400, malformed.text
+
+
+def test_streaming_endpoint_emits_final_event(http: requests.Session) -> None:
+    response = http.post(
         f"{API_BASE_URL}/api/v1/chat/message/stream",
         data={"message": "resumen"},
         headers={"Accept": "text/event-stream"},
@@ -134,18 +282,18 @@ def test_streaming_endpoint_emits_final_event() -> None:
         final_event = next((event for event in events if event["event"] == "final"), None)
         assert final_event is not None
 
-        final_payload = json.loads(final_event["data"])
+        final_payload = orjson.loads(final_event["data"])
         assert final_payload.get("conversation_id")
         assert final_payload.get("assistant_message")
     finally:
         response.close()
 
 
-def test_upload_validation_rejects_disallowed_extension(tmp_path: Path) -> None:
+def test_upload_validation_rejects_disallowed_extension(http: requests.Session, tmp_path: Path) -> None:
     blocked_file = tmp_path / "payload.exe"
     blocked_file.write_text("dummy", encoding="utf-8")
 
-    response = requests.post(
+    response = http.post(
         f"{API_BASE_URL}/api/v1/chat/message",
         data={"message": "archivo no permitido"},
         files={"file": (blocked_file.name, blocked_file.read_bytes(), "application/octet-stream")},
@@ -153,28 +301,31 @@ def test_upload_validation_rejects_disallowed_extension(tmp_path: Path) -> None:
     )
 
     assert response.status_code == 400, response.text
-    body = response.json()
+    body = _json(response)
     assert "no permitida" in body["error"]["message"].lower()
 
 
-def test_manual_correction_patch_updates_receipt(tmp_path: Path) -> None:
-    receipt_file = tmp_path / "editable.txt"
-    receipt_file.write_text(
-        "\n".join(
-            [
-                "TIENDA EDITABLE SAC",
-                "FACTURA: F002-9911",
-                "FECHA: 2026-02-23",
-                "TOTAL: 210.00",
-            ]
-        ),
-        encoding="utf-8",
+def test_invalid_conversation_id_is_rejected(http: requests.Session) -> None:
+    filename = f"invalid-conversation-{next(_COUNTER):08x}.txt"
+    response = http.post(
+        f"{API_BASE_URL}/api/v1/chat/message",
+        data={"conversation_id": "not-a-uuid", "message": "conversacion invalida"},
+        files={"file": (filename, b"TOTAL: 10.00", "text/plain")},
+        timeout=API_TIMEOUT,
     )
 
-    created = _post_chat_message(message="crear para editar", file_path=receipt_file)
-    receipt_id = created["receipt_id"]
+    assert response.status_code == 400, response.text
+    assert "conversation_id invalido" in _json(response)["error"]["message"]
+
+    if UPLOAD_DIR:
+        assert not list((Path(UPLOAD_DIR) / "incoming").glob(f"*_{filename}"))
 
-    patch_response = requests.patch(
+
+@pytest.mark.xdist_group("mutating")
+def test_manual_correction_patch_updates_receipt(http: requests.Session, duplicate_receipt: dict) -> None:
+    receipt_id = duplicate_receipt["receipt_id"]
+
+    patch_response = http.patch(
         f"{API_BASE_URL}/api/v1/receipts/{receipt_id}",
         json={
             "vendor_name": "TIENDA EDITADA SAC",
@@ -185,24 +336,35 @@ def test_manual_correction_patch_updates_receipt(tmp_path: Path) -> None:
     )
 
     assert patch_response.status_code == 200, patch_response.text
-    payload = patch_response.json()
+    payload = _json(patch_response)
     assert payload["vendor_name"] == "TIENDA EDITADA SAC"
     assert payload["total"] == 215.5
     assert payload["status"] == "manually_corrected"
 
 
-def test_advanced_insights_endpoints() -> None:
-    vendors = requests.get(f"{API_BASE_URL}/api/v1/insights/vendors?limit=5", timeout=API_TIMEOUT)
-    trend = requests.get(f"{API_BASE_URL}/api/v1/insights/trend?group_by=month", timeout=API_TIMEOUT)
-    anomalies = requests.get(f"{API_BASE_URL}/api/v1/insights/anomalies?factor=1.2&limit=5", timeout=API_TIMEOUT)
+def test_advanced_insights_endpoints(http: requests.Session) -> None:
+    paths = {
+        "vendors": "vendors?limit=5",
+        "trend": "trend?group_by=month",
+        "anomalies": "anomalies?factor=1.2&limit=5",
+    }
+    with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+        futures = {
+            name: executor.submit(http.get, f"{API_BASE_URL}/api/v1/insights/{path}", timeout=API_TIMEOUT)
+            for name, path in paths.items()
+        }
+        results = {name: future.result() for name, future in futures.items()}
+    vendors = results["vendors"]
+    trend = results["trend"]
+    anomalies = results["anomalies"]
 
     assert vendors.status_code == 200, vendors.text
     assert trend.status_code == 200, trend.text
     assert anomalies.status_code == 200, anomalies.text
 
-    vendors_body = vendors.json()
-    trend_body = trend.json()
-    anomalies_body = anomalies.json()
+    vendors_body = _json(vendors)
+    trend_body = _json(trend)
+    anomalies_body = _json(anomalies)
 
     assert isinstance(vendors_body.get("items"), list)
     assert trend_body.get("group_by") == "month"
@@ -0,0 +1,53 @@
+-- Convierte las columnas de ids de varchar(36) a uuid nativo en una base creada antes del cambio.
+-- Ejecutar una sola vez con el orchestrator detenido:
+--   psql "$DATABASE_URL" -f infra/migrations/001_uuid_ids.sql
+BEGIN;
+
+ALTER TABLE messages DROP CONSTRAINT messages_conversation_id_fkey;
+ALTER TABLE attachments DROP CONSTRAINT attachments_message_id_fkey;
+ALTER TABLE receipts DROP CONSTRAINT receipts_attachment_id_fkey;
+ALTER TABLE receipts DROP CONSTRAINT receipts_conversation_id_fkey;
+ALTER TABLE receipt_items DROP CONSTRAINT receipt_items_receipt_id_fkey;
+ALTER TABLE extraction_runs DROP CONSTRAINT extraction_runs_receipt_id_fkey;
+
+-- Antes se aceptaba cualquier conversation_id del cliente; los que no son uuid reciben uno nuevo.
+CREATE TEMP TABLE conversation_id_map ON COMMIT DROP AS
+    SELECT id AS old_id, gen_random_uuid()::text AS new_id
+    FROM conversations
+    WHERE id !~* '^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}$';
+UPDATE messages SET conversation_id = m.new_id FROM conversation_id_map m WHERE conversation_id = m.old_id;
+UPDATE receipts SET conversation_id = m.new_id FROM conversation_id_map m WHERE conversation_id = m.old_id;
+UPDATE conversations SET id = m.new_id FROM conversation_id_map m WHERE id = m.old_id;
+
+ALTER TABLE conversations ALTER COLUMN id TYPE uuid USING id::uuid;
+ALTER TABLE messages
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN conversation_id TYPE uuid USING conversation_id::uuid;
+ALTER TABLE attachments
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN message_id TYPE uuid USING message_id::uuid;
+ALTER TABLE receipts
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN conversation_id TYPE uuid USING conversation_id::uuid,
+    ALTER COLUMN attachment_id TYPE uuid USING attachment_id::uuid;
+ALTER TABLE receipt_items
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN receipt_id TYPE uuid USING receipt_id::uuid;
+ALTER TABLE extraction_runs
+    ALTER COLUMN id TYPE uuid USING id::uuid,
+    ALTER COLUMN receipt_id TYPE uuid USING receipt_id::uuid;
+
+ALTER TABLE messages ADD CONSTRAINT messages_conversation_id_fkey
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id);
+ALTER TABLE attachments ADD CONSTRAINT attachments_message_id_fkey
+    FOREIGN KEY (message_id) REFERENCES messages(id);
+ALTER TABLE receipts ADD CONSTRAINT receipts_attachment_id_fkey
+    FOREIGN KEY (attachment_id) REFERENCES attachments(id);
+ALTER TABLE receipts ADD CONSTRAINT receipts_conversation_id_fkey
+    FOREIGN KEY (conversation_id) REFERENCES conversations(id);
+ALTER TABLE receipt_items ADD CONSTRAINT receipt_items_receipt_id_fkey
+    FOREIGN KEY (receipt_id) REFERENCES receipts(id);
+ALTER TABLE extraction_runs ADD CONSTRAINT extraction_runs_receipt_id_fkey
+    FOREIGN KEY (receipt_id) REFERENCES receipts(id);
+
+COMMIT;